@@ -3,8 +3,18 @@ import os
 import re
 import csv
 import json
-import time
-import requests
+import shelve
+import hashlib
+import random
+import asyncio
+import threading
+import multiprocessing
+import concurrent.futures
+from functools import lru_cache
+from importlib.util import find_spec
+import httpx
+import orjson
+import numpy as np
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QPushButton, QTextEdit, QFileDialog, QMessageBox,
@@ -12,20 +22,104 @@ from PySide6.QtWidgets import (
 )
 from PySide6.QtGui import QFont
 from PySide6.QtCore import Qt, QThread, Signal, QObject
-from PyPDF2 import PdfReader
+from pdf_extract import RE2_AVAILABLE, extract_and_clean
 
-try:
-    from sentence_transformers import SentenceTransformer, util
-    SENTENCE_TRANSFORMER_AVAILABLE = True
-except ImportError:
-    SENTENCE_TRANSFORMER_AVAILABLE = False
+# The ML libraries are only looked up here and imported where they are used: under
+# the 'spawn' start method every extraction process re-imports this script, and
+# loading torch & co. there would cost seconds and hundreds of MB per worker.
+SENTENCE_TRANSFORMER_AVAILABLE = find_spec('sentence_transformers') is not None
+FAISS_AVAILABLE = find_spec('faiss') is not None
+ONNX_AVAILABLE = find_spec('onnxruntime') is not None and find_spec('transformers') is not None
 
 
 # --- Constants for DeepSeek API ---
 CONFIG_FILE = "config.json"
 DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
 SEMANTIC_SCORE_MODEL = 'all-MiniLM-L6-v2'
+ONNX_MODEL_DIR = "minilm_onnx"
+ONNX_MODEL_FILE = os.path.join(ONNX_MODEL_DIR, "model_int8.onnx")
 DEFAULT_DEEPSEEK_MODEL = "deepseek-chat"
+DEFAULT_WORKERS = 4
+DEFAULT_API_CONCURRENCY = 8
+API_MAX_ATTEMPTS = 5
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+DEFAULT_BATCH_SIZE = 4
+SMALL_PDF_CHARS = 6000
+BATCH_MAX_WAIT = 2.0
+PIPELINE_QUEUE_SIZE = 32
+BATCH_INSTRUCTIONS = (
+    "\n\n--- MULTIPLE DOCUMENTS ---\n"
+    "The input contains several documents, each starting with a line '=== FILE: <name> ==='. "
+    "Handle each document separately: start each document's answer with a line '### FILE: <name>' using the exact name, "
+    "followed by the category headings for that document only."
+)
+DEFAULT_MAX_CHARS = 24000
+TRUNCATE_MIN_FRACTION = 0.8
+DEFAULT_EXTRACT_WORKERS = min(os.cpu_count() or 1, 8)
+MIN_PDFS_FOR_PROCESS_POOL = 4
+_HEADING_RE = re.compile(r'(?m)^\s*(#\w+)\s*$')
+_SENTENCE_END_RE = re.compile(r'[.!?](?=\s)')
+_BATCH_FILE_RE = re.compile(r'(?m)^\s*### FILE:\s*(.+?)\s*$')
+_NON_WORD_RE = re.compile(r'\W+')
+# Backreferences, named groups and global inline flags change meaning or fail once
+# patterns are fused into one alternation.
+_UNFUSABLE_RE = re.compile(r'\\[1-9]|\\g<|\(\?P|\(\?<(?![=!])|\(\?[aiLmsux]+\)')
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pdf_categorizer")
+RESPONSE_CACHE_FILE = os.path.join(CACHE_DIR, "responses.db")
+EMPTY_AI_RESPONSE = "AI response was empty."
+SEMANTIC_CACHE_THRESHOLD = 0.97
+SEMANTIC_CACHE_WINDOW_CHARS = 1000
+NO_CONTENT_PREFIXES = ('No content found', 'No other significant content')
+
+def _truncate_text(text, max_chars):
+    if len(text) <= max_chars: return text
+    head = text[:max_chars]
+    # Prefer to cut after the last full sentence that fits in the budget, unless that
+    # would throw away much of it (e.g. tables with hardly any sentence ends).
+    cut = max((m.end() for m in _SENTENCE_END_RE.finditer(head, int(max_chars * TRUNCATE_MIN_FRACTION))), default=0)
+    return head[:cut] if cut else head
+
+def _split_batch_response(categorized_text):
+    matches = list(_BATCH_FILE_RE.finditer(categorized_text))
+    return {m.group(1): categorized_text[m.end():matches[i + 1].start() if i + 1 < len(matches) else len(categorized_text)].strip()
+            for i, m in enumerate(matches)}
+
+def _retry_delay(attempt, retry_after=None):
+    # Honour the server's Retry-After (in seconds) when given, else jittered exponential backoff.
+    if retry_after:
+        try: return min(60.0, max(0.0, float(retry_after)))
+        except ValueError: pass
+    return min(60.0, 2 ** attempt + random.random())
+
+# --- int8 ONNX scoring model (created by quantize_model.py) ---
+class OnnxSentenceEncoder:
+    """Covers the subset of the SentenceTransformer API used by the worker."""
+    def __init__(self, model_dir, model_file, num_threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = ort.SessionOptions()
+        if num_threads: options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_file, sess_options=options, providers=['CPUExecutionProvider'])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self._dim = self.session.get_outputs()[0].shape[-1]
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        if single: sentences = [sentences]
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            tokens = self.tokenizer(sentences[start:start + batch_size], padding=True, truncation=True, max_length=256, return_tensors='np')
+            feed = {k: v.astype(np.int64) for k, v in tokens.items() if k in self._input_names}
+            token_embeds = self.session.run(None, feed)[0]
+            # Mean pooling over real tokens, as in the original sentence-transformers model.
+            mask = tokens['attention_mask'][..., None].astype(np.float32)
+            embs = (token_embeds * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                embs /= np.linalg.norm(embs, axis=1, keepdims=True) + 1e-12
+            batches.append(embs.astype(np.float32))
+        embs = np.concatenate(batches) if batches else np.empty((0, self._dim), dtype=np.float32)
+        return embs[0] if single else embs
 
 # --- Worker for background processing ---
 class WorkerSignals(QObject):
@@ -40,150 +134,526 @@ class PdfProcessorWorker(QObject):
         self.config = config
         self.is_cancelled = False
         self.signals = WorkerSignals()
-        if SENTENCE_TRANSFORMER_AVAILABLE:
-            try:
-                self.score_model = SentenceTransformer(SEMANTIC_SCORE_MODEL)
-            except Exception as e:
-                self.signals.error.emit(f"Could not load scoring model: {e}")
-                self.score_model = None
-        else:
-            self.score_model = None
+        self._embedding_cache = {}
+        self._embedding_lock = threading.Lock()
+        self._response_store = None
+        self._sem_enabled = False
+        self._sem_index = None
+        self._sem_store = []
+        self._sem_lock = threading.Lock()
+        self._disclaimer_sources = None
+        self.extract_pool = None
+        self.client = None
+        self.score_pool = None
+        self._api_semaphore = None
+        self._batch_candidates = set()
+        self._pending_batch = []
+        self._batch_timer = None
+        self._batch_tasks = set()
+        self.encode_batch_size = 64
+        self._score_model = None
+        self._score_model_variant = None
+        self._score_model_loaded = False
+        self._score_model_lock = threading.Lock()
+
+    @property
+    def score_model(self):
+        # Loaded on first use so the model's cold start overlaps with extraction and the first API call.
+        with self._score_model_lock:
+            if not self._score_model_loaded:
+                self._score_model = self.load_score_model() if self.config.get('scoring', True) else None
+                if self._score_model is not None: self.load_heading_embeddings()
+                self._score_model_loaded = True
+        return self._score_model
+
+    def load_score_model(self):
+        device = 'cpu'
+        try:
+            if SENTENCE_TRANSFORMER_AVAILABLE:
+                import torch
+                if self.config.get('use_gpu', True):
+                    if torch.cuda.is_available(): device = 'cuda'
+                    elif torch.backends.mps.is_available(): device = 'mps'
+            # Share the cores between in-flight PDFs instead of letting each encode oversubscribe them.
+            cpu_threads = max(1, (os.cpu_count() or 1) // self.config.get('workers', DEFAULT_WORKERS))
+            if device == 'cpu' and ONNX_AVAILABLE and os.path.exists(ONNX_MODEL_FILE):
+                self._score_model_variant = f"{SEMANTIC_SCORE_MODEL}/onnx-int8"
+                return OnnxSentenceEncoder(ONNX_MODEL_DIR, ONNX_MODEL_FILE, num_threads=cpu_threads)
+            if SENTENCE_TRANSFORMER_AVAILABLE:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(SEMANTIC_SCORE_MODEL, device=device)
+                self._score_model_variant = f"{SEMANTIC_SCORE_MODEL}/st-{'fp16' if device == 'cuda' else 'fp32'}"
+                if device == 'cuda':
+                    model.half()
+                if device != 'cpu':
+                    self.encode_batch_size = 128
+                else:
+                    torch.set_num_threads(cpu_threads)
+                return model
+        except Exception as e:
+            self.signals.error.emit(f"Could not load scoring model: {e}")
+        return None
 
     def run(self):
         self.log_status("Starting PDF processing worker thread...")
-        processed_files = {}
+        threading.Thread(target=lambda: self.score_model, daemon=True).start()
+        self.open_response_store()
+        self.open_semantic_cache()
+        self._disclaimer_sources = self.compile_disclaimer_patterns()
 
         try:
-            pdf_files = [f for f in os.listdir(self.config['pdf_folder']) if f.lower().endswith(".pdf")]
-            total_pdfs = len(pdf_files)
-            if not pdf_files:
-                self.log_status("No PDF files found.")
-                self.signals.finished.emit()
-                return
-
-            for i, pdf_filename in enumerate(pdf_files):
-                if self.is_cancelled:
-                    self.log_status("Processing cancelled.")
-                    break
-                self.signals.progress_update.emit(int(((i + 1) / total_pdfs) * 100))
-                self.log_status(f"--- Processing {pdf_filename} ({i+1}/{total_pdfs}) ---")
-                
-                processed_files[pdf_filename] = {'FileName': pdf_filename}
-                pdf_path = os.path.join(self.config['pdf_folder'], pdf_filename)
-                categorized_data = self.process_single_pdf(pdf_path)
-                if categorized_data:
-                    processed_files[pdf_filename].update(categorized_data)
-
-            if not self.is_cancelled:
-                self.write_pivoted_csv(processed_files)
-
+            asyncio.run(self._run_async())
         except Exception as e:
             self.signals.error.emit(f"An unexpected error occurred: {e}")
         finally:
+            self.save_heading_embeddings()
+            self.close_response_store()
+            self.close_semantic_cache()
+            if self.extract_pool is not None:
+                self.extract_pool.shutdown(cancel_futures=True)
+                self.extract_pool = None
             self.signals.finished.emit()
 
-    def process_single_pdf(self, pdf_path):
-        self.log_status(f"Extracting text...")
-        cleaned_text = self.extract_and_clean_text(pdf_path)
-        if not cleaned_text: return None
+    async def _run_async(self):
+        with os.scandir(self.config['pdf_folder']) as entries:
+            pdf_files = sorted((e.name, e.path) for e in entries if e.is_file() and e.name.lower().endswith(".pdf"))
+        total_pdfs = len(pdf_files)
+        if not pdf_files:
+            self.log_status("No PDF files found.")
+            return
+
+        # Starting worker processes costs more than it saves on a handful of files or
+        # a single core. Extraction then runs in-process with a single producer, since
+        # PyMuPDF does not support being called from several threads at once. Workers
+        # are always spawned: forking now would copy the model-loading thread, Qt and httpx.
+        extract_workers = self.config.get('extract_workers', DEFAULT_EXTRACT_WORKERS)
+        if total_pdfs >= MIN_PDFS_FOR_PROCESS_POOL and extract_workers > 1:
+            self.extract_pool = concurrent.futures.ProcessPoolExecutor(max_workers=extract_workers, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            extract_workers = 1
+
+        completed = 0
+        api_concurrency = self.config.get('api_concurrency', DEFAULT_API_CONCURRENCY)
+        batch_size = self.config.get('batch_size', DEFAULT_BATCH_SIZE)
+        self._api_semaphore = asyncio.Semaphore(api_concurrency)
+        self._batch_candidates = {pdf_filename for pdf_filename, _ in pdf_files}
+        limits = httpx.Limits(max_connections=api_concurrency, max_keepalive_connections=api_concurrency)
+
+        # Extraction producers feed a bounded queue that API/scoring consumers drain,
+        # so at most PIPELINE_QUEUE_SIZE extracted texts wait in memory however large
+        # the folder is. Requests are multiplexed over one HTTP/2 connection. Rows are
+        # written as each PDF finishes, so a cancelled run keeps everything so far.
+        queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        remaining_files = iter(pdf_files)
+
+        async def produce():
+            for pdf_filename, pdf_path in remaining_files:
+                cleaned_text = await self.load_pdf_text(pdf_filename, pdf_path)
+                await queue.put((pdf_filename, cleaned_text))
+
+        async def consume():
+            nonlocal completed
+            while True:
+                pdf_filename, cleaned_text = await queue.get()
+                try:
+                    categorized_data = None
+                    if cleaned_text:
+                        categorized_data = await self.process_text(pdf_filename, cleaned_text)
+                except Exception as e:
+                    self.log_status(f"[{pdf_filename}] Error: {e}")
+                finally:
+                    self.leave_batching(pdf_filename)
+                    queue.task_done()
+
+                completed += 1
+                self.signals.progress_update.emit(int((completed / total_pdfs) * 100))
+                self.log_status(f"--- Finished {pdf_filename} ({completed}/{total_pdfs}) ---")
+                categorized_data = categorized_data or {}
+                writer.writerow([pdf_filename] + [categorized_data.get(h, '') for h in data_headers])
+                f.flush()
+
+        async def drain(producers):
+            await asyncio.gather(*producers)
+            await queue.join()
+
+        async with httpx.AsyncClient(http2=True, timeout=120, limits=limits) as self.client:
+            with open(self.config['output_file'], 'w', newline='', encoding='utf-8') as f, \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=self.config.get('workers', DEFAULT_WORKERS)) as self.score_pool:
+                headers = self.csv_headers()
+                data_headers = headers[1:]
+                writer = csv.writer(f)
+                writer.writerow(headers)
+                producers = [asyncio.create_task(produce()) for _ in range(extract_workers)]
+                consumers = [asyncio.create_task(consume()) for _ in range(api_concurrency * max(1, batch_size))]
+                pipeline = asyncio.create_task(drain(producers))
+                try:
+                    # stop() is called from the GUI thread, so poll for it while waiting.
+                    # Consumers only ever finish by raising (e.g. a failed CSV write);
+                    # that ends the run instead of leaving the producers blocked.
+                    while not pipeline.done() and not self.is_cancelled and not any(c.done() for c in consumers):
+                        await asyncio.wait({pipeline, *consumers}, timeout=0.5, return_when=asyncio.FIRST_COMPLETED)
+                    if self.is_cancelled:
+                        self.log_status("Processing cancelled.")
+                    else:
+                        for consumer in consumers:
+                            if consumer.done(): consumer.result()
+                        pipeline.result()
+                finally:
+                    for task in [pipeline, *producers, *consumers]: task.cancel()
+                    await asyncio.gather(pipeline, *producers, *consumers, return_exceptions=True)
+
+        if not self.is_cancelled:
+            self.log_status(f"\nSUCCESS! Results saved in pivoted format to: {self.config['output_file']}")
 
-        self.log_status("Sending text to DeepSeek for categorization...")
-        categorized_text = self.call_deepseek_api(cleaned_text)
+    async def load_pdf_text(self, pdf_filename, pdf_path):
+        if self.is_cancelled: return None
+        self.log_status(f"[{pdf_filename}] Extracting text...")
+        cleaned_text = await self.extract_and_clean_text(pdf_path)
+        if not cleaned_text: return None
+        max_chars = self.config.get('max_chars', DEFAULT_MAX_CHARS)
+        if len(cleaned_text) > max_chars:
+            self.log_status(f"[{pdf_filename}] Truncating text from {len(cleaned_text)} to at most {max_chars} characters...")
+            cleaned_text = _truncate_text(cleaned_text, max_chars)
+        return cleaned_text
+
+    async def process_text(self, pdf_filename, cleaned_text):
+        categorized_text = await self.categorize(pdf_filename, cleaned_text)
         if not categorized_text: return None
 
-        self.log_status(f"Parsing and Scoring AI response...")
-        return self.parse_and_score_response(categorized_text)
+        # Scoring is CPU/GPU bound, so it runs off the event loop.
+        self.log_status(f"[{pdf_filename}] Parsing and Scoring AI response...")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.score_pool, self.parse_and_score_response, categorized_text)
+
+    async def categorize(self, pdf_filename, cleaned_text):
+        # Exact repeats (same model, prompt and text) come from the response store;
+        # near-duplicates from the semantic cache; everything else goes to DeepSeek.
+        cache_key = hashlib.sha256(f"{self.config['model']}\n{self.config['instructions']}\n{cleaned_text}".encode('utf-8')).hexdigest()
+        if self.config.get('response_cache', True) and self._response_store is not None and cache_key in self._response_store:
+            self.leave_batching(pdf_filename)
+            self.log_status(f"[{pdf_filename}] Reusing cached AI response for unchanged text...")
+            return self._response_store[cache_key]
+
+        loop = asyncio.get_running_loop()
+        query_embed, categorized_text = await loop.run_in_executor(self.score_pool, self.lookup_semantic_cache, cleaned_text)
+        if categorized_text:
+            self.leave_batching(pdf_filename)
+            self.log_status(f"[{pdf_filename}] Reusing cached AI response for near-duplicate text...")
+            return categorized_text
+
+        if len(cleaned_text) <= SMALL_PDF_CHARS and self.config.get('batch_size', DEFAULT_BATCH_SIZE) > 1:
+            self.log_status(f"[{pdf_filename}] Queueing short text for a batched DeepSeek request...")
+            categorized_text, complete = await self.categorize_batched(pdf_filename, cleaned_text)
+        else:
+            self.leave_batching(pdf_filename)
+            self.log_status(f"[{pdf_filename}] Sending text to DeepSeek for categorization...")
+            categorized_text, complete = await self.call_deepseek_api(cleaned_text)
+        # Only complete answers with at least one heading are kept for later runs, so a
+        # one-off bad or cut-off answer isn't served again on every rerun.
+        if complete and categorized_text and _HEADING_RE.search(categorized_text):
+            if self._response_store is not None: self._response_store[cache_key] = categorized_text
+            self.add_to_semantic_cache(query_embed, categorized_text)
+        return categorized_text
         
-    def extract_and_clean_text(self, pdf_path):
-        text = ""
+    # Short PDFs are sent several at a time to save per-request latency. A batch is
+    # sent when it is full, when no other PDF can still join it, or after BATCH_MAX_WAIT.
+    async def categorize_batched(self, pdf_filename, cleaned_text):
+        future = asyncio.get_running_loop().create_future()
+        if not self._pending_batch:
+            self._batch_timer = asyncio.get_running_loop().call_later(BATCH_MAX_WAIT, self.flush_batch)
+        self._pending_batch.append((pdf_filename, cleaned_text, future))
+        if len(self._pending_batch) >= self.config.get('batch_size', DEFAULT_BATCH_SIZE):
+            self.flush_batch()
+        self.leave_batching(pdf_filename)
+        return await future
+
+    def leave_batching(self, pdf_filename):
+        self._batch_candidates.discard(pdf_filename)
+        if not self._batch_candidates:
+            self.flush_batch()
+
+    def flush_batch(self):
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        if not self._pending_batch: return
+        batch, self._pending_batch = self._pending_batch, []
+        task = asyncio.create_task(self.send_batch(batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def send_batch(self, batch):
         try:
-            with open(pdf_path, 'rb') as pdf_file:
-                pdf_reader = PdfReader(pdf_file)
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
-                    if page_text: text += page_text + "\n"
-            disclaimer_patterns = [p.strip() for p in self.config['disclaimers'] if p.strip()]
-            for pattern_str in disclaimer_patterns:
-                try: text = re.sub(pattern_str, '', text, flags=re.IGNORECASE | re.DOTALL)
-                except re.error as e: self.log_status(f"Warning: Invalid regex: '{pattern_str}': {e}")
-            return ' '.join(text.split())
+            sections, complete = {}, {}
+            if len(batch) > 1:
+                self.log_status(f"Sending {len(batch)} short PDFs to DeepSeek in one request...")
+                combined_text = "\n\n".join(f"=== FILE: {name} ===\n{text}" for name, text, _ in batch)
+                categorized_text, finished = await self.call_deepseek_api(combined_text, self.config['instructions'] + BATCH_INSTRUCTIONS, max_tokens=8192)
+                if categorized_text:
+                    sections = _split_batch_response(categorized_text)
+                    # A reply cut off by max_tokens ends mid-way through its last section,
+                    # so that file is asked for again; the sections before it are whole.
+                    if not finished and sections: sections.pop(next(reversed(sections)))
+                    complete = dict.fromkeys(sections, True)
+            # Anything the model left out of the combined answer is asked for on its own.
+            missing = [(name, text) for name, text, _ in batch if not sections.get(name)]
+            results = await asyncio.gather(*(self.call_deepseek_api(text) for _, text in missing))
+            for (name, _), (text, finished) in zip(missing, results):
+                sections[name], complete[name] = text, finished
+            for name, _, future in batch:
+                if not future.done(): future.set_result((sections.get(name), complete.get(name, False)))
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done(): future.set_exception(e)
+
+    def compile_disclaimer_patterns(self):
+        # Invalid patterns are dropped individually; the rest are fused into one
+        # alternation so the text is scanned once instead of once per pattern. Patterns
+        # that can't be fused safely are applied one after another instead. Only the
+        # sources are returned: each extraction process compiles and caches them.
+        valid_patterns = []
+        for pattern_str in (p.strip() for p in self.config['disclaimers'] if p.strip()):
+            try:
+                re.compile(pattern_str, re.IGNORECASE | re.DOTALL)
+                valid_patterns.append(pattern_str)
+            except re.error as e: self.log_status(f"Warning: Invalid regex: '{pattern_str}': {e}")
+        if not valid_patterns: return None
+        if self.config.get('use_re2', False) and not RE2_AVAILABLE:
+            self.log_status("Warning: RE2 matching was requested but google-re2 is not installed; using Python's re.")
+        if len(valid_patterns) == 1 or any(_UNFUSABLE_RE.search(p) for p in valid_patterns):
+            return tuple(valid_patterns)
+        fused = '|'.join(f'(?:{p})' for p in valid_patterns)
+        try:
+            re.compile(fused, re.IGNORECASE | re.DOTALL)
+        except re.error:
+            return tuple(valid_patterns)
+        return (fused,)
+
+    async def extract_and_clean_text(self, pdf_path):
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.extract_pool, extract_and_clean, pdf_path, self._disclaimer_sources, self.config.get('use_re2', False))
         except Exception as e:
             self.log_status(f"Error reading {pdf_path}: {e}")
             return None
 
-    def call_deepseek_api(self, text):
+    async def call_deepseek_api(self, text, instructions=None, max_tokens=4096):
+        # Returns (text, complete); complete is False unless DeepSeek reported finish_reason 'stop'.
         headers = { "Authorization": f"Bearer {self.config['api_key']}", "Content-Type": "application/json" }
-        messages = [{"role": "system", "content": self.config['instructions']}, {"role": "user", "content": text}]
-        payload = {"model": self.config['model'], "messages": messages, "max_tokens": 4096, "temperature": 0.2}
+        messages = [{"role": "system", "content": instructions or self.config['instructions']}, {"role": "user", "content": text}]
+        payload = {"model": self.config['model'], "messages": messages, "max_tokens": max_tokens, "temperature": 0.2}
 
-        for attempt in range(3):
+        for attempt in range(API_MAX_ATTEMPTS):
             try:
-                self.log_status(f"Contacting DeepSeek API (Attempt {attempt + 1})...")
-                response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=120)
+                async with self._api_semaphore:
+                    self.log_status(f"Contacting DeepSeek API (Attempt {attempt + 1})...")
+                    response = await self.client.post(DEEPSEEK_API_URL, headers=headers, content=orjson.dumps(payload))
+                if response.status_code in RETRY_STATUS_CODES and attempt + 1 < API_MAX_ATTEMPTS:
+                    delay = _retry_delay(attempt, response.headers.get("Retry-After"))
+                    self.log_status(f"DeepSeek API returned {response.status_code} (Attempt {attempt + 1}/{API_MAX_ATTEMPTS}), retrying in {delay:.1f}s...")
+                    await asyncio.sleep(delay)
+                    continue
                 response.raise_for_status()
-                response_json = response.json()
+                response_json = orjson.loads(response.content)
                 if response_json.get("choices"):
-                    raw_response_text = response_json["choices"][0]["message"]["content"].strip()
+                    choice = response_json["choices"][0]
+                    raw_response_text = choice["message"]["content"].strip()
                     
                     self.log_status(f"---- AI RAW RESPONSE ----\n{raw_response_text}\n--------------------------")
+                    if choice.get("finish_reason") != "stop":
+                        self.log_status(f"Warning: DeepSeek response ended early (finish_reason: {choice.get('finish_reason')}).")
                     
-                    return raw_response_text
+                    return raw_response_text, choice.get("finish_reason") == "stop"
                 else: 
                     self.log_status("---- AI RAW RESPONSE ----\nAI response was empty or had no 'choices'.\n--------------------------")
-                    return "AI response was empty."
-            except requests.exceptions.RequestException as e:
-                self.log_status(f"DeepSeek API Error (Attempt {attempt + 1}/3): {e}")
-                time.sleep(2 ** attempt)
+                    return EMPTY_AI_RESPONSE, False
+            except httpx.HTTPStatusError as e:
+                # Anything not in RETRY_STATUS_CODES (bad key, bad request, ...) won't succeed on retry.
+                self.log_status(f"DeepSeek API Error: {e}")
+                return None, False
+            except (httpx.TransportError, orjson.JSONDecodeError) as e:
+                self.log_status(f"DeepSeek API Error (Attempt {attempt + 1}/{API_MAX_ATTEMPTS}): {e}")
+                if attempt + 1 < API_MAX_ATTEMPTS: await asyncio.sleep(_retry_delay(attempt))
         self.log_status("DeepSeek API failed after multiple retries.")
-        return None
+        return None, False
 
     def parse_and_score_response(self, categorized_text):
         file_data = {}
-        chunks = re.split(r'(?m)^\s*(#\w+)\s*$', categorized_text)
-        content_blocks = chunks[1:] if chunks and chunks[0].strip() == '' else chunks
-        if not content_blocks:
+        matches = list(_HEADING_RE.finditer(categorized_text))
+        if not matches:
             self.log_status(f"Warning: Could not parse any #KEYWORDS from AI response.")
             return file_data
             
-        for i in range(0, len(content_blocks), 2):
-            if i + 1 < len(content_blocks):
-                category = content_blocks[i].replace('#', '').strip().upper()
-                content = content_blocks[i+1].strip()
-                if content:
-                    score = -1
-                    if self.score_model:
-                        try:
-                            cat_embed = self.score_model.encode(category, convert_to_tensor=True)
-                            con_embed = self.score_model.encode(content, convert_to_tensor=True)
-                            score = round(util.pytorch_cos_sim(cat_embed, con_embed).item(), 4)
-                        except Exception as e:
-                            self.log_status(f"Could not calculate score for '{category}': {e}")
-                    
-                    file_data[f'{category}_Score'] = score
-                    file_data[f'{category}_Content'] = content
+        # Each heading's content runs up to the next heading; any preamble before
+        # the first heading is ignored.
+        categories, contents = [], []
+        for i, match in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(categorized_text)
+            content = categorized_text[match.end():end].strip()
+            if content:
+                categories.append(match.group(1).lstrip('#').upper())
+                contents.append(content)
+
+        # The prompt makes the AI answer unmatched headings with a fixed phrase;
+        # those get a flat 0.0 instead of going through the encoder.
+        is_empty = [c.lstrip('-*• ').startswith(NO_CONTENT_PREFIXES) for c in contents]
+        scores = [0.0 if empty else -1 for empty in is_empty]
+        to_score = [i for i, empty in enumerate(is_empty) if not empty]
+        if self.score_model and to_score:
+            try:
+                E_cat = self.cached_encode([self.heading_label(categories[i]) for i in to_score])
+                E_con = self.score_model.encode([contents[i] for i in to_score], batch_size=self.encode_batch_size, convert_to_numpy=True, normalize_embeddings=True)
+                for i, score in zip(to_score, np.round(np.einsum('ij,ij->i', E_cat, E_con), 4).tolist()):
+                    scores[i] = score
+            except Exception as e:
+                self.log_status(f"Could not calculate scores: {e}")
+
+        for category, content, score in zip(categories, contents, scores):
+            file_data[f'{category}_Score'] = score
+            file_data[f'{category}_Content'] = content
         
         self.log_status(f"Successfully parsed and scored {len(file_data) // 2} categories.")
         return file_data
 
-    def write_pivoted_csv(self, processed_files_dict):
-        if not processed_files_dict:
-            self.log_status("\nProcess finished, but no content was categorized.")
-            return
+    def heading_label(self, heading):
+        # Headings are scored against the keyword as the user wrote it, not the #\w+ token.
+        return self.config.get('keyword_labels', {}).get(heading, heading)
 
-        all_headers = set(['FileName'])
-        for file_data in processed_files_dict.values():
-            all_headers.update(file_data.keys())
-        
-        sorted_headers = ['FileName'] + sorted([h for h in all_headers if h != 'FileName'])
+    def heading_cache_keys(self):
+        return {hashlib.sha256(self.heading_label(k).encode('utf-8')).hexdigest() for k in self.config['keywords']}
+
+    def embedding_cache_path(self):
+        # Embeddings only transfer between runs that used the same model, runtime and precision.
+        key = hashlib.sha256(self._score_model_variant.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(CACHE_DIR, f"embeddings-{key}.db")
 
+    # Only the keyword heading embeddings are persisted: content summaries never
+    # repeat. The shelve is opened and closed within each call, so it never crosses
+    # threads (some dbm backends, e.g. dbm.sqlite3 on Python 3.13+, refuse that).
+    def load_heading_embeddings(self):
         try:
-            with open(self.config['output_file'], 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=sorted_headers)
-                writer.writeheader()
-                writer.writerows(processed_files_dict.values())
-            self.log_status(f"\nSUCCESS! Results saved in pivoted format to: {self.config['output_file']}")
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with shelve.open(self.embedding_cache_path()) as store:
+                for key in self.heading_cache_keys():
+                    emb = store.get(key)
+                    if emb is not None: self._embedding_cache[key] = emb
+        except Exception as e:
+            self.log_status(f"Warning: Could not read embedding cache, using memory only: {e}")
+
+    def save_heading_embeddings(self):
+        if self._score_model is None: return
+        with self._embedding_lock:
+            embs = {key: self._embedding_cache[key] for key in self.heading_cache_keys() if key in self._embedding_cache}
+        if not embs: return
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with shelve.open(self.embedding_cache_path()) as store:
+                store.update(embs)
+        except Exception as e:
+            self.log_status(f"Warning: Could not save embedding cache: {e}")
+
+    def open_response_store(self):
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            self._response_store = shelve.open(RESPONSE_CACHE_FILE)
+        except Exception as e:
+            self.log_status(f"Warning: Could not open response cache: {e}")
+            self._response_store = None
+
+    def close_response_store(self):
+        if self._response_store is not None:
+            self._response_store.close()
+            self._response_store = None
+
+    def cached_encode(self, texts):
+        # Heading embeddings are normalized and keyed by SHA-256 of the text, so each
+        # heading only ever hits the model once. This runs on the scoring threads, so
+        # it only uses the in-memory cache.
+        keys = [hashlib.sha256(t.encode('utf-8')).hexdigest() for t in texts]
+        embs = [None] * len(texts)
+        misses = []
+        with self._embedding_lock:
+            for i, key in enumerate(keys):
+                emb = self._embedding_cache.get(key)
+                if emb is None: misses.append(i)
+                else: embs[i] = emb
+
+        if misses:
+            new_embs = self.score_model.encode([texts[i] for i in misses], batch_size=self.encode_batch_size, convert_to_numpy=True, normalize_embeddings=True)
+            with self._embedding_lock:
+                for i, emb in zip(misses, new_embs.astype(np.float16)):
+                    embs[i] = self._embedding_cache[keys[i]] = emb
+
+        embs = np.array(embs, dtype=np.float32)
+        # Re-normalize in place: the float16 round trip leaves rows slightly off unit length.
+        embs /= np.linalg.norm(embs, axis=1, keepdims=True) + 1e-12
+        return embs
+
+    def semantic_cache_paths(self):
+        # Responses only transfer between runs that used the same model and prompt.
+        key = hashlib.sha256(f"{self.config['model']}\n{self.config['instructions']}".encode('utf-8')).hexdigest()[:16]
+        base = os.path.join(CACHE_DIR, f"responses-v2-{key}")
+        return base + ".faiss", base + ".json"
+
+    def open_semantic_cache(self):
+        if not (FAISS_AVAILABLE and self.config.get('scoring', True) and self.config.get('semantic_cache', False)): return
+        index_path, store_path = self.semantic_cache_paths()
+        try:
+            import faiss
+            if os.path.exists(index_path) and os.path.exists(store_path):
+                self._sem_index = faiss.read_index(index_path)
+                with open(store_path, 'r', encoding='utf-8') as f: self._sem_store = json.load(f)
+            self._sem_enabled = True
+        except Exception as e:
+            self.log_status(f"Warning: Could not open semantic response cache: {e}")
+            self._sem_index = None
+
+    def close_semantic_cache(self):
+        self._sem_enabled = False
+        if self._sem_index is None: return
+        index_path, store_path = self.semantic_cache_paths()
+        try:
+            import faiss
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            faiss.write_index(self._sem_index, index_path)
+            with open(store_path, 'w', encoding='utf-8') as f: json.dump(self._sem_store, f)
+        except Exception as e:
+            self.log_status(f"Warning: Could not save semantic response cache: {e}")
+        self._sem_index = None
+
+    def lookup_semantic_cache(self, text):
+        # Until the model has loaded in the background, go straight to the API rather
+        # than wait for it, so the load still overlaps with the first requests.
+        if not self._sem_enabled or not self._score_model_loaded or self.score_model is None: return None, None
+        try:
+            # The model only reads the first 256 tokens of its input, and reports from
+            # the same series share their opening pages, so the whole document is
+            # embedded window by window and the windows are averaged.
+            windows = [text[i:i + SEMANTIC_CACHE_WINDOW_CHARS] for i in range(0, len(text), SEMANTIC_CACHE_WINDOW_CHARS)]
+            embs = self.score_model.encode(windows, batch_size=self.encode_batch_size, convert_to_numpy=True, normalize_embeddings=True)
+            query = embs.mean(axis=0, keepdims=True).astype(np.float32)
+            query /= np.linalg.norm(query, axis=1, keepdims=True) + 1e-12
         except Exception as e:
-            self.signals.error.emit(f"Error saving CSV file: {e}")
+            self.log_status(f"Warning: Could not embed text for semantic response cache: {e}")
+            return None, None
+        with self._sem_lock:
+            if self._sem_index is not None and self._sem_index.ntotal:
+                D, I = self._sem_index.search(query, 1)
+                if D[0, 0] > SEMANTIC_CACHE_THRESHOLD: return query, self._sem_store[I[0, 0]]
+        return query, None
+
+    def add_to_semantic_cache(self, query_embed, categorized_text):
+        if query_embed is None: return
+        with self._sem_lock:
+            if self._sem_index is None:
+                import faiss
+                self._sem_index = faiss.IndexFlatIP(query_embed.shape[1])
+            self._sem_index.add(query_embed)
+            self._sem_store.append(categorized_text)
+
+    def csv_headers(self):
+        # The prompt restricts the AI to these headings, so the header is known up front.
+        return ['FileName'] + sorted(f'{k}_{suffix}' for k in self.config['keywords'] for suffix in ('Score', 'Content'))
 
     def stop(self):
         self.is_cancelled = True
@@ -193,6 +663,51 @@ class PdfProcessorWorker(QObject):
         self.signals.status_update.emit(message)
 
 
+# --- Prompt construction ---
+def _parse_keywords(keywords_str):
+    # Returns sorted (heading, label) pairs. Headings are parsed back as #\w+, so the
+    # heading token and CSV column use that form ('US DOLLAR' -> 'US_DOLLAR',
+    # 'S&P' -> 'S_P'); the label keeps the user's wording for the prompt and scoring.
+    keywords = {}
+    for label in (k.strip() for k in keywords_str.split(',')):
+        heading = _NON_WORD_RE.sub('_', label.upper()).strip('_')
+        if heading: keywords.setdefault(heading, label)
+    return tuple(sorted(keywords.items()))
+
+def _csv_keywords(keywords, include_other):
+    return keywords + (('OTHER',) if include_other and 'OTHER' not in keywords else ())
+
+@lru_cache(maxsize=32)
+def _build_prompt(keywords, include_other):
+    base_prompt = (
+        "You are a highly specialized text extraction tool. Your one and only job is to find and extract text that is strictly relevant to the category headings provided below. "
+        "DO NOT create any new category headings that are not in the list. "
+        "DO NOT extract information for any topics not listed in the headings. "
+        "For each heading, provide a summary. If no relevant text is found for a heading, you MUST write 'No content found for [HEADING_NAME].'"
+    )
+
+    include_other = include_other and 'OTHER' not in dict(keywords)
+    allowed_headings_list = [f"#{heading}" for heading, _ in keywords]
+    if include_other:
+        allowed_headings_list.append("#OTHER")
+
+    allowed_headings_instruction = f"The ONLY category headings you are allowed to use in your response are: {', '.join(allowed_headings_list)}."
+
+    keyword_examples = []
+    for heading, keyword in keywords:
+        example = (f"#{heading}\n"
+                   f"[If you find any content related to {keyword}, summarize it here as a bulleted list. If you find nothing, write 'No content found for {keyword}.']")
+        keyword_examples.append(example)
+
+    if include_other:
+        other_example = ("#OTHER\n"
+                         "[If you find any other significant financial topics, summarize them here as a bulleted list. If not, write 'No other significant content found.']")
+        keyword_examples.append(other_example)
+
+    return (f"{base_prompt}\n\n{allowed_headings_instruction}\n\n"
+            f"--- EXAMPLES OF REQUIRED FORMAT ---\n" + "\n\n".join(keyword_examples))
+
+
 # --- Main Application Window ---
 class PDFCategorizerGUI(QMainWindow):
     def __init__(self):
@@ -207,37 +722,10 @@ class PDFCategorizerGUI(QMainWindow):
         self.load_settings()
 
     def build_prompt_from_keywords(self, keywords_str, include_other):
-        if not keywords_str.strip(): return "" 
-
-        keywords = [k.strip().upper() for k in keywords_str.split(',')]
-        
-        base_prompt = (
-            "You are a highly specialized text extraction tool. Your one and only job is to find and extract text that is strictly relevant to the category headings provided below. "
-            "DO NOT create any new category headings that are not in the list. "
-            "DO NOT extract information for any topics not listed in the headings. "
-            "For each heading, provide a summary. If no relevant text is found for a heading, you MUST write 'No content found for [HEADING_NAME].'"
-        )
-
-        allowed_headings_list = [f"#{k}" for k in keywords]
-        if include_other:
-            allowed_headings_list.append("#OTHER")
-        
-        allowed_headings_instruction = f"The ONLY category headings you are allowed to use in your response are: {', '.join(allowed_headings_list)}."
+        keywords = _parse_keywords(keywords_str)
+        if not keywords: return ""
 
-        keyword_examples = []
-        for keyword in keywords:
-            example = (f"#{keyword}\n"
-                       f"[If you find any content related to {keyword}, summarize it here as a bulleted list. If you find nothing, write 'No content found for {keyword}.']")
-            keyword_examples.append(example)
-
-        if include_other:
-            other_example = ("#OTHER\n"
-                             "[If you find any other significant financial topics, summarize them here as a bulleted list. If not, write 'No other significant content found.']")
-            keyword_examples.append(other_example)
-
-        final_prompt = (f"{base_prompt}\n\n{allowed_headings_instruction}\n\n"
-                        f"--- EXAMPLES OF REQUIRED FORMAT ---\n" + "\n\n".join(keyword_examples))
-        
+        final_prompt = _build_prompt(keywords, include_other)
         self.log_status("Built final restrictive prompt for AI...")
         return final_prompt
 
@@ -282,6 +770,9 @@ class PDFCategorizerGUI(QMainWindow):
         disclaimer_layout.addWidget(QLabel("<b>Disclaimer Removal Patterns (Regex - One per line)</b>"))
         self.disclaimer_text = QTextEdit("This document is for informational purposes only.*?\nDisclaimer:.*?All rights reserved\\.")
         disclaimer_layout.addWidget(self.disclaimer_text)
+        self.use_re2_checkbox = QCheckBox("Match with RE2 (linear time; \\s, \\w, \\d and \\b match ASCII characters only)")
+        self.use_re2_checkbox.setChecked(False)
+        disclaimer_layout.addWidget(self.use_re2_checkbox)
         self.main_layout.addWidget(disclaimer_frame)
         
         instructions_frame = QFrame(); instructions_frame.setFrameShape(QFrame.StyledPanel)
@@ -294,6 +785,22 @@ class PDFCategorizerGUI(QMainWindow):
         self.include_other_checkbox = QCheckBox("Include an '#OTHER' category for miscellaneous content")
         self.include_other_checkbox.setChecked(True)
         instructions_layout.addWidget(self.include_other_checkbox)
+
+        self.scoring_checkbox = QCheckBox("Calculate relevance scores")
+        self.scoring_checkbox.setChecked(True)
+        instructions_layout.addWidget(self.scoring_checkbox)
+
+        self.use_gpu_checkbox = QCheckBox("Use the GPU for relevance scoring when available")
+        self.use_gpu_checkbox.setChecked(True)
+        instructions_layout.addWidget(self.use_gpu_checkbox)
+
+        self.response_cache_checkbox = QCheckBox("Reuse saved AI answers for unchanged PDFs (untick to ask DeepSeek again)")
+        self.response_cache_checkbox.setChecked(True)
+        instructions_layout.addWidget(self.response_cache_checkbox)
+
+        self.semantic_cache_checkbox = QCheckBox("Reuse AI answers for near-identical PDFs (requires faiss)")
+        self.semantic_cache_checkbox.setChecked(False)
+        instructions_layout.addWidget(self.semantic_cache_checkbox)
         
         self.main_layout.addWidget(instructions_frame)
         
@@ -356,6 +863,7 @@ class PDFCategorizerGUI(QMainWindow):
         keywords = self.keywords_entry.text()
         should_include_other = self.include_other_checkbox.isChecked()
         instructions = self.build_prompt_from_keywords(keywords, should_include_other)
+        parsed_keywords = _parse_keywords(keywords)
         
         if not instructions:
             QMessageBox.critical(self, "Error", "Could not start: Instructions could not be built from keywords.")
@@ -365,7 +873,14 @@ class PDFCategorizerGUI(QMainWindow):
         config = {
             'api_key': self.api_key_entry.text(), 'model': self.model_entry.text().strip(),
             'pdf_folder': self.pdf_folder_entry.text(), 'output_file': self.output_file_entry.text(),
-            'instructions': instructions, 'disclaimers': self.disclaimer_text.toPlainText().strip().split('\n')
+            'instructions': instructions, 'disclaimers': self.disclaimer_text.toPlainText().strip().split('\n'),
+            'scoring': self.scoring_checkbox.isChecked(),
+            'use_gpu': self.use_gpu_checkbox.isChecked(),
+            'response_cache': self.response_cache_checkbox.isChecked(),
+            'semantic_cache': self.semantic_cache_checkbox.isChecked(),
+            'use_re2': self.use_re2_checkbox.isChecked(),
+            'keywords': _csv_keywords(tuple(heading for heading, _ in parsed_keywords), should_include_other),
+            'keyword_labels': dict(parsed_keywords)
         }
         
         self.thread = QThread()
@@ -399,7 +914,12 @@ class PDFCategorizerGUI(QMainWindow):
             'api_key': self.api_key_entry.text(), 'model': self.model_entry.text(),
             'pdf_folder': self.pdf_folder_entry.text(), 'output_file': self.output_file_entry.text(),
             'disclaimers': self.disclaimer_text.toPlainText(), 'keywords': self.keywords_entry.text(),
-            'include_other': self.include_other_checkbox.isChecked()
+            'include_other': self.include_other_checkbox.isChecked(),
+            'scoring': self.scoring_checkbox.isChecked(),
+            'use_gpu': self.use_gpu_checkbox.isChecked(),
+            'response_cache': self.response_cache_checkbox.isChecked(),
+            'semantic_cache': self.semantic_cache_checkbox.isChecked(),
+            'use_re2': self.use_re2_checkbox.isChecked()
         }
         try:
             with open(CONFIG_FILE, 'w') as f: json.dump(settings, f, indent=4)
@@ -418,6 +938,11 @@ class PDFCategorizerGUI(QMainWindow):
                     self.disclaimer_text.setPlainText(settings.get('disclaimers', ''))
                     self.keywords_entry.setText(settings.get('keywords', ''))
                     self.include_other_checkbox.setChecked(settings.get('include_other', True))
+                    self.scoring_checkbox.setChecked(settings.get('scoring', True))
+                    self.use_gpu_checkbox.setChecked(settings.get('use_gpu', True))
+                    self.response_cache_checkbox.setChecked(settings.get('response_cache', True))
+                    self.semantic_cache_checkbox.setChecked(settings.get('semantic_cache', False))
+                    self.use_re2_checkbox.setChecked(settings.get('use_re2', False))
                 self.log_status("Settings loaded successfully.")
             else: self.log_status("No config file found. Using default settings.")
         except Exception as e: self.log_status(f"Error loading settings: {e}")
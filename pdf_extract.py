@@ -0,0 +1,37 @@
+import re
+from functools import lru_cache
+import fitz
+
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
+
+# --- Text extraction ---
+# Runs in the extraction worker processes. Under the 'spawn' start method (macOS,
+# Windows) each worker imports this module, so it must not pull in the GUI or ML
+# libraries that pdf.py loads.
+
+def _compile_disclaimer(source, use_re2):
+    # Opt-in: RE2 matches in linear time, so a user pattern can't backtrack
+    # catastrophically on a large document, but its \s, \w, \d and \b are ASCII-only
+    # (e.g. \s no longer matches a non-breaking space). Patterns RE2 can't express
+    # (e.g. backreferences) fall back to re.
+    if use_re2 and RE2_AVAILABLE:
+        try: return re2.compile(f'(?is){source}')
+        except re2.error: pass
+    return re.compile(source, re.IGNORECASE | re.DOTALL)
+
+@lru_cache(maxsize=8)
+def compile_disclaimers(sources, use_re2=False):
+    return tuple(_compile_disclaimer(source, use_re2) for source in sources)
+
+def extract_and_clean(pdf_path, disclaimer_sources, use_re2=False):
+    with fitz.open(pdf_path) as doc:
+        parts = [page.get_text("text", flags=fitz.TEXTFLAGS_TEXT | fitz.TEXT_DEHYPHENATE) for page in doc]
+    text = '\n'.join(p for p in parts if p)
+    if disclaimer_sources:
+        for pattern in compile_disclaimers(disclaimer_sources, use_re2):
+            text = pattern.sub('', text)
+    return ' '.join(text.split())
@@ -0,0 +1,23 @@
+import os
+from optimum.onnxruntime import ORTModelForFeatureExtraction
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from transformers import AutoTokenizer
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+OUTPUT_DIR = "minilm_onnx"
+
+# Export the scoring model to ONNX (one-off, run from the project folder)
+print(f"Exporting {MODEL_NAME} to ONNX in '{OUTPUT_DIR}'...")
+model = ORTModelForFeatureExtraction.from_pretrained(MODEL_NAME, export=True)
+model.save_pretrained(OUTPUT_DIR)
+AutoTokenizer.from_pretrained(MODEL_NAME).save_pretrained(OUTPUT_DIR)
+
+# Dynamic int8 quantization of the weights
+print("Quantizing weights to int8...")
+quantize_dynamic(
+    os.path.join(OUTPUT_DIR, "model.onnx"),
+    os.path.join(OUTPUT_DIR, "model_int8.onnx"),
+    weight_type=QuantType.QInt8,
+)
+
+print(f"\n✅ Saved {os.path.join(OUTPUT_DIR, 'model_int8.onnx')}. pdf.py will now use it for scoring.")